@@ -1,25 +1,65 @@
+import asyncio
+import collections
+import concurrent.futures
+import contextlib
+import io
+import logging
 import os
+import secrets
+import shutil
 import subprocess
-import uuid
-from typing import TYPE_CHECKING, List, Tuple
+import sys
+import traceback
+from dataclasses import dataclass
+from typing import TYPE_CHECKING, Dict, Iterable, Iterator, List, Optional, Set, Tuple, Union
 
 import pytest
+import requests
+from requests.adapters import HTTPAdapter
 from azure.mgmt.dns import DnsManagementClient
+from azure.core.pipeline.transport import RequestsTransport
 from azure.identity import ClientSecretCredential, AzureCliCredential
+from certbot.main import main as certbot_main
+
+from certbot_dns_azure._internal.dns_azure import _CachingCredential
 
 if TYPE_CHECKING:
     import pathlib
 
-AZURE_ENV = os.getenv("AZURE_ENVIRONMENT", "AzurePublicCloud")
-EMAIL = os.getenv('EMAIL', 'NOT_AN_EMAIL')
 
+@dataclass(frozen=True)
+class _Env:
+    """Snapshot of the environment variables used by the tests, read once at import"""
+    tenant_id: Optional[str]
+    client_id: Optional[str]
+    client_secret: Optional[str]
+    email: str
+    azure_env: str
+    # Run each certbot invocation in a separate process instead of in the test interpreter
+    certbot_subprocess: bool
+
+
+_ENV = _Env(
+    tenant_id=os.environ.get('AZURE_TENANT_ID'),
+    client_id=os.environ.get('AZURE_CLIENT_ID'),
+    client_secret=os.environ.get('AZURE_CLIENT_SECRET'),
+    email=os.getenv('EMAIL', 'NOT_AN_EMAIL'),
+    azure_env=os.getenv('AZURE_ENVIRONMENT', 'AzurePublicCloud'),
+    certbot_subprocess='CERTBOT_TEST_SUBPROCESS' in os.environ,
+)
+
+_HAVE_CREDS = {'AZURE_TENANT_ID', 'EMAIL'}.issubset(os.environ)
 azure_creds = pytest.mark.skipif(
-    any(env not in os.environ for env in ['AZURE_TENANT_ID', 'EMAIL']),
+    not _HAVE_CREDS,
     reason="Missing 'AZURE_TENANT_ID' or 'EMAIL' environment variables"
 )
 
 SUBSCRIPTION_ID = '90907259-f568-40c9-be09-768317e458ae'
 RESOURCE_GROUP = 'certbot'
+DELETE_WORKERS = 16
+ARM_SCOPE = 'https://management.azure.com//.default'
+# Zone records that must never be deleted
+_SKIP_RECORD_TYPES = frozenset(('NS', 'SOA'))
 
 ZONES = {
     'zone1.certbot-dns-azure.co.uk': '/subscriptions/90907259-f568-40c9-be09-768317e458ae/resourceGroups/certbot',  # /providers/Microsoft.Network/dnszones/zone1.certbot-dns-azure.co.uk
@@ -31,46 +71,133 @@ DELEGATION_ZONE2 = '/subscriptions/90907259-f568-40c9-be09-768317e458ae/resource
 
 
 def get_cert_names(count: int = 1) -> List[str]:
-    return [uuid.uuid4().hex for _ in range(count)]
+    return [secrets.token_hex(16) for _ in range(count)]
 
 
 @pytest.fixture(scope='session')
-def azure_dns_client() -> DnsManagementClient:
-    if 'AZURE_CLIENT_SECRET' in os.environ:
+def azure_dns_client() -> Iterator[DnsManagementClient]:
+    if _ENV.client_secret is not None:
         creds = ClientSecretCredential(
-            client_id=os.environ['AZURE_CLIENT_ID'],
-            client_secret=os.environ['AZURE_CLIENT_SECRET'],
-            tenant_id=os.environ['AZURE_TENANT_ID'],
+            client_id=_ENV.client_id,
+            client_secret=_ENV.client_secret,
+            tenant_id=_ENV.tenant_id,
             authority='https://login.microsoftonline.com/'
         )
     else:
-        creds = AzureCliCredential(tenant_id=os.environ['AZURE_TENANT_ID'])
-    return DnsManagementClient(creds, SUBSCRIPTION_ID, None, 'https://management.azure.com/', credential_scopes=['https://management.azure.com//.default'])
+        creds = AzureCliCredential(tenant_id=_ENV.tenant_id)
+    creds = _CachingCredential(creds)
+    creds.get_token(ARM_SCOPE)  # Warm the cache before any fixture talks to Azure
+
+    # Size the connection pool to the delete thread pool, otherwise requests discards the
+    # connections above its default pool size of 10 and concurrent deletes redo TLS handshakes
+    session = requests.Session()
+    session.mount('https://', HTTPAdapter(pool_connections=1, pool_maxsize=DELETE_WORKERS))
+    transport = RequestsTransport(session=session, session_owner=False)
+
+    client = DnsManagementClient(creds, SUBSCRIPTION_ID, None, 'https://management.azure.com/',
+                                 credential_scopes=[ARM_SCOPE], transport=transport)
+    yield client
+    client.close()
+    session.close()
+
+
+def delete_records(azure_dns_client: DnsManagementClient, records: List[Tuple[str, str, str]]) -> None:
+    """
+    Deletes record sets concurrently, logging and continuing on failure
+
+    :param azure_dns_client: Azure DNS client
+    :param records: List of (zone, record name, record type)
+    """
+    def delete(record: Tuple[str, str, str]) -> None:
+        zone, rr_name, rr_type = record
+        try:
+            azure_dns_client.record_sets.delete(RESOURCE_GROUP, zone, rr_name, rr_type)
+            print(f"Deleted {zone}/{rr_name}")
+        except Exception as err:
+            print(f"Tried to delete {zone}/{rr_name}, got: {err}")
+
+    if not records:
+        return
+    with concurrent.futures.ThreadPoolExecutor(max_workers=DELETE_WORKERS) as executor:
+        list(executor.map(delete, records))
+
+
+def list_records(azure_dns_client: DnsManagementClient, zones: Iterable[str] = ZONES) -> List[Tuple[str, str, str]]:
+    """
+    Lists all record sets, other than NS and SOA, in the given zones
+
+    :param azure_dns_client: Azure DNS client
+    :param zones: Zones to list, defaults to all zones defined in ZONES
+    :returns: List of (zone, record name, record type)
+    """
+    def list_zone(zone: str) -> List[Tuple[str, str, str]]:
+        return [
+            (zone, rr.name, rr_type)
+            for rr in azure_dns_client.record_sets.list_by_dns_zone(RESOURCE_GROUP, zone)
+            if (rr_type := rr.type.rpartition('/')[2]) not in _SKIP_RECORD_TYPES
+        ]
+
+    zones = list(zones)
+    if not zones:
+        return []
+    # Page through the zones in parallel rather than one after another
+    with concurrent.futures.ThreadPoolExecutor(max_workers=len(zones)) as executor:
+        return [record for records in executor.map(list_zone, zones) for record in records]
+
+
+@pytest.fixture(scope='session')
+def dns_sweep(azure_dns_client) -> Iterator[Dict[str, Set[str]]]:
+    """
+    Sweeps records left behind by the session's tests at session end
+
+    Only zones that had records created during this session are listed, and only records
+    starting with a name created during this session are removed. The names are random, so
+    sessions on other pytest-xdist workers aren't affected.
+
+    :param azure_dns_client: pytest dns client fixture
+    :returns: Record names created during the session, by zone
+    """
+    session_records = collections.defaultdict(set)  # type: Dict[str, Set[str]]
+
+    yield session_records
+
+    delete_records(azure_dns_client, [
+        record for record in list_records(azure_dns_client, session_records)
+        if record[1].startswith(tuple(session_records[record[0]]))
+    ])
+
+
+@pytest.fixture
+def dns_records() -> Dict[str, Set[str]]:
+    """
+    Record names the test creates, by zone. Tests add to this so cleanup_dns can delete them
+
+    :returns: Empty mapping of zone to relative record names
+    """
+    return collections.defaultdict(set)
 
 
 @pytest.fixture(scope='function', autouse=True)
-def cleanup_dns(azure_dns_client):
+def cleanup_dns(azure_dns_client, dns_sweep, dns_records):
     """
-    Cleans up all records in all zones defined in ZONES
+    Deletes the TXT records the test added to dns_records
+
+    The records are deleted by name, without listing the zones, and zones the test didn't
+    touch are skipped. Anything left behind is picked up by dns_sweep at the end of the session.
 
     :param azure_dns_client: pytest dns client fixture
+    :param dns_sweep: pytest session sweep fixture
+    :param dns_records: pytest created records fixture
     """
     yield
 
-    for zone in ZONES:
-        to_delete = []
-        for rr in azure_dns_client.record_sets.list_by_dns_zone(RESOURCE_GROUP, zone):
-            rr_type = rr.type.rsplit('/', 1)[-1]
-            if rr_type in ('NS', 'SOA'):
-                continue
-
-            to_delete.append((rr.name, rr_type))
-        for rr_name, rr_type in to_delete:
-            try:
-                azure_dns_client.record_sets.delete(RESOURCE_GROUP, zone, rr_name, rr_type)
-                print(f"Deleted {zone}/{rr_name}")
-            except Exception as err:
-                print(f"Tried to delete {zone}/{rr_name}, got: {err}")
+    to_delete = []
+    for zone, names in dns_records.items():
+        if not names:
+            continue
+        dns_sweep[zone].update(names)
+        to_delete.extend((zone, name, 'TXT') for name in names)
+    delete_records(azure_dns_client, to_delete)
 
 
 def create_config(tmpdir: 'pathlib.Path', zones: List[str]) -> str:
@@ -82,28 +209,178 @@ def create_config(tmpdir: 'pathlib.Path', zones: List[str]) -> str:
     :returns: Filepath to config
     """
     config = {
-        # 'dns_azure_sp_client_id': os.environ['AZURE_CLIENT_ID'],
-        # 'dns_azure_sp_client_secret': os.environ['AZURE_CLIENT_SECRET'],
+        # 'dns_azure_sp_client_id': _ENV.client_id,
+        # 'dns_azure_sp_client_secret': _ENV.client_secret,
         'dns_azure_use_cli_credentials': 'true',
-        'dns_azure_tenant_id': os.environ['AZURE_TENANT_ID'],
-        'dns_azure_environment': AZURE_ENV,
+        'dns_azure_tenant_id': _ENV.tenant_id,
+        'dns_azure_environment': _ENV.azure_env,
     }
     for index, zone in enumerate(zones, start=1):
         config[f"dns_azure_zone{index}"] = zone
 
-    config_text = '\n'.join([' = '.join(item) for item in config.items()]) + '\n'
+    config_text = ''.join(f"{key} = {value}\n" for key, value in config.items())
     config_file = tmpdir / "config.ini"
-    config_file.write_text(config_text)
-    config_file.chmod(0o600)
+    # Create the file with its final permissions so it's never readable by others
+    fd = os.open(str(config_file), os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+    try:
+        os.write(fd, config_text.encode())
+    finally:
+        os.close(fd)
     return str(config_file)
 
 
-def run_certbot(certbot_path: 'pathlib.Path', config_file: str, fqdns: List[str], *, dry_run: bool = False) -> Tuple[subprocess.Popen, str, str]:
+class CertbotError(Exception):
+    """Raised when certbot exits with a non-zero return code"""
+
+    def __init__(self, returncode: int, stdout: str, stderr: str):
+        super().__init__(f"Error, return code {returncode}\nSTDERR:\n{stderr}\nSTDOUT:\n{stdout}")
+        self.returncode = returncode
+        self.stdout = stdout
+        self.stderr = stderr
+
+
+def _exit_code(result: Optional[Union[str, int]]) -> Tuple[int, str]:
+    """
+    Converts a certbot main() return value into a process style exit code
+
+    :param result: Value certbot would pass to sys.exit
+    :returns: Exit code and any error message
+    """
+    if result is None:
+        return 0, ''
+    if isinstance(result, int):
+        return result, ''
+    return 1, f"{result}\n"
+
+
+def _run_certbot_in_process(args: List[str]) -> Tuple[int, str, str]:
+    """
+    Runs certbot inside the test interpreter, so certbot, the plugin and the Azure SDK are only imported once
+
+    Certbot installs signal handlers, so this has to run on the main thread. The logging
+    handlers, root logger level and excepthook certbot sets up are reset afterwards so runs
+    don't leak into each other.
+
+    :param args: Certbot arguments, without the certbot executable
+    :returns: Exit code, stdout and stderr
+    """
+    root_logger = logging.getLogger()
+    handlers = root_logger.handlers[:]
+    level = root_logger.level
+    excepthook = sys.excepthook
+
+    stdout, stderr = io.StringIO(), io.StringIO()
+    try:
+        with contextlib.redirect_stdout(stdout), contextlib.redirect_stderr(stderr):
+            try:
+                returncode, message = _exit_code(certbot_main(args))
+            except SystemExit as exc:
+                returncode, message = _exit_code(exc.code)
+            except Exception:  # Certbot raises errors.Error subclasses on failure, which the CLI turns into exit code 1
+                returncode, message = 1, traceback.format_exc()
+    finally:
+        for handler in root_logger.handlers[:]:
+            if handler not in handlers:
+                root_logger.removeHandler(handler)
+                handler.close()
+        root_logger.setLevel(level)
+        sys.excepthook = excepthook
+
+    return returncode, stdout.getvalue(), stderr.getvalue() + message
+
+
+async def _wait_for_exit(proc: subprocess.Popen) -> None:
+    """
+    Waits for a process to exit without blocking the event loop
+
+    A pidfd for the process is registered with the event loop's selector, so there are no
+    threads blocked in waitpid. Falls back to waiting on an executor thread if pidfd_open
+    isn't available (non Linux, or kernels older than 5.3).
+
+    :param proc: Process to wait for
+    """
+    loop = asyncio.get_running_loop()
+    try:
+        pidfd = os.pidfd_open(proc.pid)
+    except (AttributeError, OSError):
+        await loop.run_in_executor(None, proc.wait)
+        return
+
+    exited = loop.create_future()
+    loop.add_reader(pidfd, lambda: exited.done() or exited.set_result(None))
+    try:
+        await exited
+    finally:
+        loop.remove_reader(pidfd)
+        os.close(pidfd)
+    proc.wait()  # Already exited, this only reaps it
+
+
+async def _run_certbot_subprocess(args: List[str]) -> Tuple[int, str, str]:
+    """
+    Runs certbot in a separate process
+
+    :param args: Certbot command line
+    :returns: Exit code, stdout and stderr
+    """
+    loop = asyncio.get_running_loop()
+    with subprocess.Popen(args, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True) as proc:
+        # Drain both pipes while waiting so certbot can't block on a full pipe
+        output = asyncio.gather(
+            loop.run_in_executor(None, proc.stdout.read),
+            loop.run_in_executor(None, proc.stderr.read),
+        )
+        try:
+            await _wait_for_exit(proc)
+            stdout, stderr = await output
+        except BaseException:
+            # Cancelled or failed while certbot is still running, don't leave it behind
+            proc.kill()
+            await asyncio.gather(output, return_exceptions=True)
+            raise
+    return proc.returncode, stdout, stderr
+
+
+def _certbot_dir_args(certbot_path: 'pathlib.Path') -> List[str]:
+    return ['--config-dir', str(certbot_path), '--work-dir', str(certbot_path), '--logs-dir', str(certbot_path)]
+
+
+async def _run_certbot(args: List[str]) -> Tuple[int, str, str]:
+    """
+    Runs certbot, in the test interpreter unless CERTBOT_TEST_SUBPROCESS is set
+
+    In-process runs block the event loop, so only subprocess runs overlap when gathered.
+
+    :param args: Certbot command line
+    :returns: Exit code, stdout and stderr
+    :raises CertbotError: If certbot exits with a non-zero return code
+    """
+    if _ENV.certbot_subprocess:
+        returncode, stdout, stderr = await _run_certbot_subprocess(args)
+    else:
+        returncode, stdout, stderr = _run_certbot_in_process(args[1:])
+    if returncode != 0:
+        raise CertbotError(returncode, stdout, stderr)
+
+    return returncode, stdout, stderr
+
+
+async def run_certbot(certbot_path: 'pathlib.Path', config_file: str, fqdns: List[str], *, dry_run: bool = False) -> Tuple[int, str, str]:
+    """
+    Runs certbot certonly for the given domains
+
+    :param certbot_path: Directory used as certbot's config, work and logs directory
+    :param config_file: Path to the certbot azure dns config
+    :param fqdns: Domains to request a certificate for
+    :param dry_run: Run certbot with --dry-run
+    :returns: Exit code, stdout and stderr
+    :raises CertbotError: If certbot exits with a non-zero return code
+    """
     args = [
         'certbot', 'certonly', '--authenticator', 'dns-azure', '--preferred-challenges', 'dns', '--noninteractive',
         '--agree-tos',
-        '--email', EMAIL,
-        '--config-dir', certbot_path, '--work-dir', certbot_path, '--logs-dir', certbot_path,
+        '--email', _ENV.email,
+        *_certbot_dir_args(certbot_path),
         '--dns-azure-config', config_file,
     ]
     if dry_run:
@@ -111,29 +388,79 @@ def run_certbot(certbot_path: 'pathlib.Path', config_file: str, fqdns: List[str]
     for fqdn in fqdns:
         args.extend(['-d', fqdn])
 
-    proc = subprocess.Popen(args, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
-    stdout, stderr = proc.communicate()
-    if proc.returncode != 0:
-        print(f"Error, return code {proc.returncode}\nSTDERR:\n{stderr}\nSTDOUT:\n{stdout}")
-        pytest.fail()
+    return await _run_certbot(args)
+
+
+@pytest.fixture(scope='session')
+def certbot_base(tmp_path_factory) -> 'pathlib.Path':
+    """
+    Registers an ACME account once per session
+
+    Tests copy this directory as their certbot directory, so certbot finds the
+    account instead of registering a new one on every run.
+
+    :param tmp_path_factory: pytest temporary path factory fixture
+    :returns: Certbot directory containing the registered account
+    """
+    base = tmp_path_factory.mktemp('certbot')
+    try:
+        asyncio.run(_run_certbot([
+            'certbot', 'register', '--noninteractive', '--agree-tos', '--email', _ENV.email, *_certbot_dir_args(base)
+        ]))
+    except CertbotError as err:
+        pytest.fail(str(err))
+    return base
+
+
+@pytest.fixture
+def certbot_path(tmp_path, certbot_base) -> 'pathlib.Path':
+    """
+    Certbot directory for the test, with the session's ACME account already registered
 
-    return proc, stdout, stderr
+    :param tmp_path: pytest temporary path fixture
+    :param certbot_base: pytest registered account fixture
+    :returns: Certbot directory
+    """
+    return shutil.copytree(certbot_base, tmp_path / "certbot")
 
 
 @azure_creds
-def test_single_zone(tmp_path, azure_dns_client):
+@pytest.mark.asyncio
+@pytest.mark.parametrize('fqdn,zone_entry,record', [
+    # {name} is replaced with a random record name per run
+    pytest.param('{name}.zone1.certbot-dns-azure.co.uk',
+                 f"zone1.certbot-dns-azure.co.uk:{ZONES['zone1.certbot-dns-azure.co.uk']}",
+                 ('zone1.certbot-dns-azure.co.uk', '_acme-challenge.{name}'),
+                 id='single_zone'),
+    # domain is del1, but we're explicitly overriding the zone to del2, so the challenge record
+    # is created in del2 with the full del1 validation name
+    pytest.param('del1.certbot-dns-azure.co.uk',
+                 f"del1.certbot-dns-azure.co.uk:{DELEGATION_ZONE}",
+                 ('del2.certbot-dns-azure.co.uk', '_acme-challenge.del1.certbot-dns-azure.co.uk'),
+                 id='delegation_other_domain'),
+    # domain is del1, but we're explicitly overriding to an alternate record of del1, which is
+    # emptied rather than deleted
+    pytest.param('test.del1.certbot-dns-azure.co.uk',
+                 f"test.del1.certbot-dns-azure.co.uk:{DELEGATION_ZONE2}",
+                 None,
+                 id='delegation_specific_record'),
+])
+async def test_cert(dns_records, tmp_path, certbot_path, azure_dns_client, fqdn, zone_entry, record):
     """
-    Tests getting a certificate for a single zone
+    Tests getting a certificate for a single domain
     """
-    certbot_path = tmp_path / "certbot"
-    zone = 'zone1.certbot-dns-azure.co.uk'
-    rr_name = get_cert_names(1)[0]
-    fqdn = f"{rr_name}.{zone}"
+    name = get_cert_names(1)[0]
+    fqdn = fqdn.format(name=name)
+    if record is not None:
+        zone, rr_name = record
+        dns_records[zone].add(rr_name.format(name=name))
 
-    zone_entry = f"{zone}:{ZONES[zone]}"
     config_file = create_config(tmp_path, [zone_entry])
 
-    proc, stdout, stderr = run_certbot(certbot_path, config_file, [fqdn])
+    try:
+        returncode, stdout, stderr = await run_certbot(certbot_path, config_file, [fqdn])
+    except CertbotError as err:
+        pytest.fail(str(err))
 
     cert_path = certbot_path / 'archive' / fqdn / 'cert1.pem'
     if not cert_path.exists():
@@ -142,15 +469,17 @@ def test_single_zone(tmp_path, azure_dns_client):
 
 
 @azure_creds
-def test_multi_zone(tmp_path, azure_dns_client):
+@pytest.mark.asyncio
+async def test_multi_zone(dns_records, tmp_path, certbot_path, azure_dns_client):
     """
     Tests getting a certificate for multiple zones
     """
-    certbot_path = tmp_path / "certbot"
     zone1 = 'zone1.certbot-dns-azure.co.uk'
     zone2 = 'zone2.certbot-dns-azure.co.uk'
 
     rr_name1, rr_name2 = get_cert_names(2)
+    dns_records[zone1].add(f"_acme-challenge.{rr_name1}")
+    dns_records[zone2].add(f"_acme-challenge.{rr_name2}")
     fqdn1 = f"{rr_name1}.{zone1}"
     fqdn2 = f"{rr_name2}.{zone2}"
 
@@ -158,7 +487,10 @@ def test_multi_zone(tmp_path, azure_dns_client):
     zone_entry2 = f"{zone2}:{ZONES[zone2]}"
     config_file = create_config(tmp_path, [zone_entry1, zone_entry2])
 
-    proc, stdout, stderr = run_certbot(certbot_path, config_file, [fqdn1, fqdn2])
+    try:
+        returncode, stdout, stderr = await run_certbot(certbot_path, config_file, [fqdn1, fqdn2])
+    except CertbotError as err:
+        pytest.fail(str(err))
 
     cert_path1 = certbot_path / 'archive' / fqdn1 / 'cert1.pem'
     cert_path2 = certbot_path / 'archive' / fqdn2 / 'cert1.pem'
@@ -168,42 +500,32 @@ def test_multi_zone(tmp_path, azure_dns_client):
 
 
 @azure_creds
-def test_delegation_other_domain(tmp_path, azure_dns_client):
-    """
-    Tests getting a certificate for a single zone
-    """
-    certbot_path = tmp_path / "certbot"
-    fqdn = 'del1.certbot-dns-azure.co.uk'
-
-    # domain is del1, but we're explicitly overriding the zone to del2
-    config_file = create_config(tmp_path, [
-        f"{fqdn}:{DELEGATION_ZONE}"
-    ])
-
-    proc, stdout, stderr = run_certbot(certbot_path, config_file, [fqdn])
-
-    cert_path = certbot_path / 'archive' / fqdn / 'cert1.pem'
-    if not cert_path.exists():
-        print(f"STDOUT:\n{stdout}")
-        pytest.fail(f"Certificate path {cert_path} does not exist")
-
-
-@azure_creds
-def test_delegation_specific_record(tmp_path, azure_dns_client):
+# In process certbot runs one at a time, which would only repeat test_cert[single_zone]
+# with two more certificates against the rate limit
+@pytest.mark.skipif(not _ENV.certbot_subprocess, reason="Concurrent runs need CERTBOT_TEST_SUBPROCESS")
+@pytest.mark.asyncio
+async def test_concurrent_single_zone(dns_records, tmp_path, certbot_base, azure_dns_client):
     """
-    Tests getting a certificate for a single zone
+    Tests getting certificates for a single zone from concurrent certbot runs
     """
-    certbot_path = tmp_path / "certbot"
-    fqdn = 'test.del1.certbot-dns-azure.co.uk'
-
-    # domain is del1, but we're explicitly overriding to an alternate record of del1
-    config_file = create_config(tmp_path, [
-        f"{fqdn}:{DELEGATION_ZONE2}"
-    ])
+    zone = 'zone1.certbot-dns-azure.co.uk'
+    rr_names = get_cert_names(2)
+    dns_records[zone].update(f"_acme-challenge.{rr_name}" for rr_name in rr_names)
 
-    proc, stdout, stderr = run_certbot(certbot_path, config_file, [fqdn])
+    zone_entry = f"{zone}:{ZONES[zone]}"
+    config_file = create_config(tmp_path, [zone_entry])
 
-    cert_path = certbot_path / 'archive' / fqdn / 'cert1.pem'
-    if not cert_path.exists():
-        print(f"STDOUT:\n{stdout}")
-        pytest.fail(f"Certificate path {cert_path} does not exist")
+    fqdns = [f"{rr_name}.{zone}" for rr_name in rr_names]
+    certbot_paths = [shutil.copytree(certbot_base, tmp_path / f"certbot{index}") for index in range(len(fqdns))]
+    try:
+        results = await asyncio.gather(*[
+            run_certbot(certbot_path, config_file, [fqdn]) for certbot_path, fqdn in zip(certbot_paths, fqdns)
+        ])
+    except CertbotError as err:
+        pytest.fail(str(err))
+
+    for certbot_path, fqdn, (returncode, stdout, stderr) in zip(certbot_paths, fqdns, results):
+        cert_path = certbot_path / 'archive' / fqdn / 'cert1.pem'
+        if not cert_path.exists():
+            print(f"STDOUT:\n{stdout}")
+            pytest.fail(f"Certificate path {cert_path} does not exist")
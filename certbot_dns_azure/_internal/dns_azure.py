@@ -1,22 +1,83 @@
 """DNS Authenticator for Azure DNS."""
 import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
 import time
 import random
 from os import getenv
-from typing import Dict, Tuple
+from typing import Any, Dict, NamedTuple, Optional, Tuple
 
+import requests
+from requests.adapters import HTTPAdapter
 from azure.mgmt.dns import DnsManagementClient
 from azure.mgmt.dns.models import RecordSet, TxtRecord
+from azure.core.credentials import AccessToken, TokenCredential
 from azure.core.exceptions import HttpResponseError
-from azure.core.utils import CaseInsensitiveDict
-from azure.identity import ClientSecretCredential, ManagedIdentityCredential, CertificateCredential, AzureCliCredential, WorkloadIdentityCredential
+from azure.core.pipeline.policies import RetryPolicy
+from azure.core.pipeline.transport import RequestsTransport
 
 from certbot import errors
+from certbot.display import util as display_util
 from certbot.plugins import dns_common
 
 logger = logging.getLogger(__name__)
 logging.getLogger('azure').setLevel(logging.WARNING)
 
+# Retries on concurrent modification of a TXT record, sleeping between RETRY_BASE_SECONDS
+# and RETRY_CAP_SECONDS
+MAX_RETRIES = 11
+RETRY_BASE_SECONDS = 1
+RETRY_CAP_SECONDS = 30
+# Maximum number of challenges to update concurrently
+MAX_WORKERS = 8
+
+# Config file options read by the plugin, other than zone mappings
+_CONF_KEYS = ('sp_client_id', 'sp_client_secret', 'sp_certificate_path', 'tenant_id', 'msi_client_id',
+              'msi_system_assigned', 'use_cli_credentials', 'use_workload_identity_credentials', 'environment')
+
+# Azure environment name (lowercase) -> (Resource Manager endpoint, Active Directory endpoint)
+_AZURE_ENV_ENDPOINTS = {
+    "azurepubliccloud": ("https://management.azure.com/", "https://login.microsoftonline.com/"),
+    "azureusgovernmentcloud": ("https://management.usgovcloudapi.net/", "https://login.microsoftonline.us/"),
+    "azurechinacloud": ("https://management.chinacloudapi.cn/", "https://login.chinacloudapi.cn/"),
+    "azuregermancloud": ("https://management.microsoftazure.de/", "https://login.microsoftonline.de/"),
+}  # type: Dict[str, Tuple[str, str]]
+
+
+class ParsedZone(NamedTuple):
+    """Parsed form of a zone mapping's resource ID"""
+    subscription_id: Optional[str]
+    resource_group: Optional[str]
+    # Alternate Azure DNS zone to create records in, if the ID points to a zone
+    dns_zone: Optional[str]
+    # Explicit TXT record to use, if the ID points to a record
+    txt_record: Optional[str]
+
+
+class _CachingCredential:
+    """
+    Wraps an Azure credential, reusing tokens until they are close to expiry
+
+    Not all credentials cache tokens themselves, AzureCliCredential runs `az` and
+    ManagedIdentityCredential can call IMDS for every token requested.
+    """
+    # Refresh tokens this many seconds before they expire
+    refresh_margin = 300
+
+    def __init__(self, credential: TokenCredential):
+        self.credential = credential
+        self._tokens = {}  # type: Dict[Tuple, AccessToken]
+        self._lock = threading.Lock()
+
+    def get_token(self, *scopes: str, **kwargs: Any) -> AccessToken:
+        key = (scopes, tuple(sorted(kwargs.items())))
+        with self._lock:
+            token = self._tokens.get(key)
+            if token is None or token.expires_on - self.refresh_margin <= time.time():
+                token = self.credential.get_token(*scopes, **kwargs)
+                self._tokens[key] = token
+            return token
+
 
 class Authenticator(dns_common.DNSAuthenticator):
     """DNS Authenticator for Azure DNS
@@ -31,28 +92,16 @@ class Authenticator(dns_common.DNSAuthenticator):
     def __init__(self, *args, **kwargs):
         super(Authenticator, self).__init__(*args, **kwargs)
         self.credential = None
-        self.domain_zoneid = {}  # type: Dict[str, str]
+        self.domain_zoneinfo = {}  # type: Dict[str, ParsedZone]
+        self._clients = {}  # type: Dict[str, DnsManagementClient]
+        self._clients_lock = threading.Lock()
+        self._zone_trie = {}  # type: Dict[str, Any]
+        self._setup_lock = threading.Lock()
+        self._setup_done = False
+        self._conf_snapshot = {}  # type: Dict[str, Any]
 
         # Azure Environmental Support
         self._azure_environment = getenv("AZURE_ENVIRONMENT", "AzurePublicCloud").lower()
-        self._azure_endpoints = {
-            "azurepubliccloud": {
-                "ResourceManagerEndpoint": "https://management.azure.com/",
-                "ActiveDirectoryEndpoint": "https://login.microsoftonline.com/"
-            },
-            "azureusgovernmentcloud": {
-                "ResourceManagerEndpoint": "https://management.usgovcloudapi.net/",
-                "ActiveDirectoryEndpoint": "https://login.microsoftonline.us/"
-            },
-            "azurechinacloud": {
-                "ResourceManagerEndpoint": "https://management.chinacloudapi.cn/",
-                "ActiveDirectoryEndpoint": "https://login.chinacloudapi.cn/"
-            },
-            "azuregermancloud": {
-                "ResourceManagerEndpoint": "https://management.microsoftazure.de/",
-                "ActiveDirectoryEndpoint": "https://login.microsoftonline.de/"
-            }
-        }
 
     @classmethod
     def add_parser_arguments(cls, add):  # pylint: disable=arguments-differ
@@ -64,19 +113,94 @@ class Authenticator(dns_common.DNSAuthenticator):
         return 'This plugin configures a DNS TXT record to respond to a dns-01 challenge using ' + \
                'the Azure DNS API.'
 
+    def perform(self, achalls):  # pylint: disable=missing-function-docstring
+        self._ensure_setup()
+
+        self._attempt_cleanup = True
+
+        self._run_concurrently(self._add_validations, self._group_challenges(achalls))
+
+        # DNS updates take time to propagate and checking to see if the update has occurred is not
+        # reliable (the machine this code is running on might be able to see an update before
+        # the ACME server). So: we sleep for a short amount of time we believe to be long enough.
+        display_util.notify("Waiting %d seconds for DNS changes to propagate" %
+                            self.conf('propagation-seconds'))
+        time.sleep(self.conf('propagation-seconds'))
+
+        return [achall.response(achall.account_key) for achall in achalls]
+
+    def cleanup(self, achalls):  # pylint: disable=missing-function-docstring
+        try:
+            if self._attempt_cleanup:
+                self._ensure_setup()
+                self._run_concurrently(self._remove_validations, self._group_challenges(achalls))
+        finally:
+            self._close_azure_clients()
+
+    def _group_challenges(self, achalls):
+        """
+        Groups challenges by the TXT record they validate with, e.g. a wildcard and its apex
+        domain both use _acme-challenge.<domain>, so each record is updated once with all of
+        its values rather than once per challenge racing itself into 412 retries
+
+        :param achalls: Annotated challenges
+        :return: List of (domain, record IDs from _get_ids_for_domain, set of validations)
+        """
+        groups = {}  # type: Dict[Tuple, Tuple[str, Tuple, set]]
+        for achall in achalls:
+            domain = achall.domain
+            ids = self._get_ids_for_domain(domain, achall.validation_domain_name(domain))
+            validation = achall.validation(achall.account_key)
+            if ids in groups:
+                groups[ids][2].add(validation)
+            else:
+                groups[ids] = (domain, ids, {validation})
+        return list(groups.values())
+
+    @staticmethod
+    def _run_concurrently(func, calls):
+        """
+        Calls func(*args) for each set of args on a thread pool, as each call is a couple of
+        round trips to the Azure API
+
+        :param func: _add_validations or _remove_validations
+        :param calls: List of argument tuples
+        :raises Exception: The first error raised by a call, once all calls have finished
+        """
+        if not calls:
+            return
+
+        with ThreadPoolExecutor(max_workers=min(MAX_WORKERS, len(calls))) as executor:
+            futures = [executor.submit(func, *args) for args in calls]
+        for future in futures:
+            future.result()
+
+    def _ensure_setup(self):
+        """
+        Sets up credentials, the zone trie and endpoints once, even if called from several threads
+        """
+        if not self._setup_done:
+            with self._setup_lock:
+                if not self._setup_done:
+                    self._setup_credentials()
+                    self._setup_done = True
+
     def _validate_credentials(self, credentials):
-        sp_client_id = credentials.conf('sp_client_id')
-        sp_client_secret = credentials.conf('sp_client_secret')
-        sp_certificate_path = credentials.conf('sp_certificate_path')
-        tenant_id = credentials.conf('tenant_id')
+        # Read the config once, _setup_credentials uses the same values
+        conf = self._conf_snapshot = {key: credentials.conf(key) for key in _CONF_KEYS}
+
+        sp_client_id = conf['sp_client_id']
+        sp_client_secret = conf['sp_client_secret']
+        sp_certificate_path = conf['sp_certificate_path']
+        tenant_id = conf['tenant_id']
         has_sp = all((sp_client_id, any((sp_client_secret, sp_certificate_path)), tenant_id))
 
-        msi_client_id = credentials.conf('msi_client_id')
-        msi_system_assigned = credentials.conf('msi_system_assigned')
+        msi_client_id = conf['msi_client_id']
+        msi_system_assigned = conf['msi_system_assigned']
 
-        use_azure_cli_creds = credentials.conf('use_cli_credentials')
+        use_azure_cli_creds = conf['use_cli_credentials']
 
-        use_workload_identity_creds = credentials.conf('use_workload_identity_credentials')
+        use_workload_identity_creds = conf['use_workload_identity_credentials']
 
         if not any((has_sp, msi_system_assigned, msi_client_id, use_azure_cli_creds, use_workload_identity_creds)):
             raise errors.PluginError('{}: No authentication methods have been '
@@ -85,71 +209,99 @@ class Authenticator(dns_common.DNSAuthenticator):
                                      'managed identity or configure the use of '
                                      'azure cli or workload identity credentials'.format(credentials.confobj.filename))
 
-        has_zone_mapping = any((key for key in credentials.confobj.keys() if 'azure_zone' in key))
+        zone_mappings = list(self._iter_zone_mappings(credentials.confobj))
 
-        if not has_zone_mapping:
+        if not zone_mappings:
             raise errors.PluginError('{}: At least one zone mapping needs to be provided,'
                                      ' e.g dns_azure_zone1 = DOMAIN:DNS_ZONE_RESOURCE_GROUP_ID'
                                      ''.format(credentials.confobj.filename))
 
         # Azure Environment
-        environment = credentials.conf('environment')
+        environment = conf['environment']
 
         if environment:
             self._azure_environment = environment.lower()
 
-        self._arm_endpoint = self._azure_endpoints[self._azure_environment]["ResourceManagerEndpoint"]
-        self._aad_endpoint = self._azure_endpoints[self._azure_environment]["ActiveDirectoryEndpoint"]
-        
-        # Check we have key value
-        dns_zone_mapping_items_has_colon = [':' in value
-                                            for key, value in credentials.confobj.items()
-                                            if 'azure_zone' in key]
-        if not all(dns_zone_mapping_items_has_colon):
-            raise errors.PluginError('{}: DNS Zone mapping is not in the format of '
-                                     'DOMAIN:DNS_ZONE_RESOURCE_GROUP_ID'
-                                     ''.format(credentials.confobj.filename))
+        self._arm_endpoint, self._aad_endpoint = _AZURE_ENV_ENDPOINTS[self._azure_environment]
+
+        # Convert dns_azure_zoneX = key:value into key:parsed resource ID, so bad IDs fail
+        # here rather than part way through a renewal
+        domain_zoneinfo = {}
+        for domain, zone_id in zone_mappings:
+            try:
+                domain_zoneinfo[domain] = self._parse_zone(zone_id)
+            except ValueError as exc:
+                raise errors.PluginError('{}: Failed to parse resource ID for {}: {}'
+                                         ''.format(credentials.confobj.filename, domain, zone_id)) from exc
+        self.domain_zoneinfo = domain_zoneinfo
+
+    @staticmethod
+    def _iter_zone_mappings(confobj):
+        """
+        Yields (domain, resource ID) for each dns_azure_zoneX = DOMAIN:RESOURCE_ID in the config
+
+        :raises errors.PluginError: If a zone mapping is missing the colon
+        """
+        for key, value in confobj.items():
+            if 'azure_zone' not in key:
+                continue
+            domain, sep, zone_id = value.partition(':')
+            if not sep:
+                raise errors.PluginError('{}: DNS Zone mapping is not in the format of '
+                                         'DOMAIN:DNS_ZONE_RESOURCE_GROUP_ID'
+                                         ''.format(confobj.filename))
+            yield domain, zone_id
 
     def _setup_credentials(self):
         # Alias's dns-azure-credentials -> dns-azure-config
         if self.config.namespace.dns_azure_credentials:
             self.config.namespace.dns_azure_config = self.config.namespace.dns_azure_credentials
 
-        valid_creds = self._configure_credentials(
+        self._configure_credentials(
             'config',
             'Azure config INI file',
             None,
             self._validate_credentials
         )
 
-        # Convert dns_azure_zoneX = key:value into key:value
-        dns_zone_mapping_items = [value for key, value in valid_creds.confobj.items()
-                                  if 'azure_zone' in key]
-        self.domain_zoneid = dict([item.split(':', 1) for item in dns_zone_mapping_items])
+        self._zone_trie = self._build_zone_trie(self.domain_zoneinfo)
 
         # Figure out which credential type we're going to use
-        sp_client_id = valid_creds.conf('sp_client_id')
-        sp_client_secret = valid_creds.conf('sp_client_secret')
-        sp_certificate_path = valid_creds.conf('sp_certificate_path')
-        tenant_id = valid_creds.conf('tenant_id')
-        msi_client_id = valid_creds.conf('msi_client_id')
-        use_azure_cli_creds = valid_creds.conf('use_cli_credentials')
-        use_workload_identity_creds = valid_creds.conf('use_workload_identity_credentials')
-
-        self.credential = self._get_azure_credentials(
+        conf = self._conf_snapshot
+        sp_client_id = conf['sp_client_id']
+        sp_client_secret = conf['sp_client_secret']
+        sp_certificate_path = conf['sp_certificate_path']
+        tenant_id = conf['tenant_id']
+        msi_client_id = conf['msi_client_id']
+        use_azure_cli_creds = conf['use_cli_credentials']
+        use_workload_identity_creds = conf['use_workload_identity_credentials']
+
+        self.credential = _CachingCredential(self._get_azure_credentials(
             sp_client_id, sp_client_secret, sp_certificate_path, tenant_id, msi_client_id, use_azure_cli_creds, use_workload_identity_creds, self._aad_endpoint
-        )
+        ))
+
+        # Fetch the token now, as for some credentials (e.g. azure cli) it takes a while, so it's
+        # cached before the first DNS update. Errors are raised again when the token is needed.
+        try:
+            self.credential.get_token(self._arm_endpoint + "/.default")
+        except Exception as err:  # pylint: disable=broad-except
+            logger.debug('Failed to get Azure token ahead of DNS updates: %s', err)
 
     @staticmethod
     def _get_azure_credentials(client_id=None, client_secret=None, certificate_path=None, tenant_id=None, msi_client_id=None,
                                use_azure_cli_creds=None, use_workload_identity_creds=None, aad_endpoint=None):
         has_sp = all((client_id, client_secret, tenant_id))
         has_sp_cert = all((client_id, certificate_path, tenant_id))
+        # azure.identity is imported here rather than at the top, so it's only loaded when the
+        # plugin is used and not whenever certbot discovers its plugins
         if use_azure_cli_creds:  # TODO move to DefaultAzureCredential
+            from azure.identity import AzureCliCredential
             return AzureCliCredential(tenant_id=tenant_id)
         elif use_workload_identity_creds:
+            from azure.identity import WorkloadIdentityCredential
             return WorkloadIdentityCredential(tenant_id=tenant_id)
         elif has_sp:
+            from azure.identity import ClientSecretCredential
             return ClientSecretCredential(
                 client_id=client_id,
                 client_secret=client_secret,
@@ -157,6 +309,7 @@ class Authenticator(dns_common.DNSAuthenticator):
                 authority=aad_endpoint
             )
         elif has_sp_cert:
+            from azure.identity import CertificateCredential
             return CertificateCredential(
                 client_id=client_id,
                 certificate_path=certificate_path,
@@ -164,10 +317,29 @@ class Authenticator(dns_common.DNSAuthenticator):
                 authority=aad_endpoint
             )
         elif msi_client_id:
+            from azure.identity import ManagedIdentityCredential
             return ManagedIdentityCredential(client_id=msi_client_id)
         else:
+            from azure.identity import ManagedIdentityCredential
             return ManagedIdentityCredential()
 
+    @staticmethod
+    def _build_zone_trie(domain_zoneinfo: Dict[str, ParsedZone]) -> Dict[str, Any]:
+        """
+        Builds a trie of the configured domains keyed by their labels in reverse,
+        e.g. test.domain.io is stored under io -> domain -> test
+
+        :param domain_zoneinfo: Domain to parsed zone mapping from the config file
+        :return: Trie where nodes for configured domains have a `$` key holding (domain, parsed zone)
+        """
+        trie = {}  # type: Dict[str, Any]
+        for domain, zone in domain_zoneinfo.items():
+            node = trie
+            for label in reversed(domain.split('.')):
+                node = node.setdefault(label, {})
+            node['$'] = (domain, zone)
+        return trie
+
     def _get_ids_for_domain(self, domain: str, validation_name: str) -> Tuple[str, str, str, str, bool]:
         """
         :param domain: Domain/subdomain to look up the closest parent in the config file
@@ -182,51 +354,127 @@ class Authenticator(dns_common.DNSAuthenticator):
         """
         # So if the config contains domain.io and test.domain.io
         # and we want to renew, we'd prefer test.domain.io.
-        # Sort domains by longest first and then attempt to find the right one.
-        # This should work better, as then a.b.test.domain.io would pick domain.io irrelevant
-        # of its order in the config
-        azure_domains = sorted(self.domain_zoneid.keys(), key=lambda domain: len(domain), reverse=True)
-
-        try:
-            for azure_dns_domain in azure_domains:
-                # Look to see if domain ends with key, to cover subdomains
-                if domain.endswith(azure_dns_domain):
-                    zone_id = self.domain_zoneid[azure_dns_domain]
-
-                    try:
-                        resource = self.parse_azure_resource_id(zone_id)
-                    except ValueError as exc:
-                        raise errors.PluginError('Failed to parse resource ID for {}: {}'
-                                                 .format(domain, zone_id)) from exc
-                    subscription_id = resource.get('subscriptions')
-                    rg_name = resource.get('resourceGroups')
-                    if 'dnsZones' in resource:  # If we're manually specifying an alternate zone to use, override.
-                        azure_dns_domain = resource.get('dnsZones')
-                    relative_validation_name = self._get_relative_domain(validation_name, azure_dns_domain)
-                    can_delete = True
-                    if 'TXT' in resource:  # If we're explicitly specifing a destination record, use instead.
-                        relative_validation_name = resource.get('TXT')
-                        can_delete = False  # If we're specifying a specific record, dont delete it
-
-                    return azure_dns_domain, subscription_id, rg_name, relative_validation_name, can_delete
-            else:
-                raise errors.PluginError('Domain {} does not have a valid domain to '
-                                         'resource group id mapping'.format(domain))
-        except IndexError:
-            raise errors.PluginError('Domain {} has an invalid resource group id'.format(domain))
+        # Walk the trie from the top level label down, remembering the deepest configured
+        # domain passed, so a.b.test.domain.io picks test.domain.io irrelevant of its order
+        # in the config, and a.b.domain.io picks domain.io
+        match = None
+        node = self._zone_trie
+        for label in reversed(domain.split('.')):
+            node = node.get(label)
+            if node is None:
+                break
+            match = node.get('$', match)
+
+        if match is None:
+            raise errors.PluginError('Domain {} does not have a valid domain to '
+                                     'resource group id mapping'.format(domain))
+        azure_dns_domain, zone = match
+
+        if zone.dns_zone is not None:  # If we're manually specifying an alternate zone to use, override.
+            azure_dns_domain = zone.dns_zone
+        relative_validation_name = self._get_relative_domain(validation_name, azure_dns_domain)
+        can_delete = True
+        if zone.txt_record is not None:  # If we're explicitly specifing a destination record, use instead.
+            relative_validation_name = zone.txt_record
+            can_delete = False  # If we're specifying a specific record, dont delete it
+
+        return azure_dns_domain, zone.subscription_id, zone.resource_group, relative_validation_name, can_delete
 
     @staticmethod
     def _get_relative_domain(fqdn: str, domain: str) -> str:
-        if fqdn == domain:
-            return '@'
-        return fqdn.replace(domain, '').strip('.')
+        domain = domain.rstrip('.')
+        # Names not in the zone, e.g. a CNAME delegated from another domain, are used as is
+        return '@' if fqdn == domain else fqdn.removesuffix('.' + domain)
+
+    def _perform(self, domain, validation_name, validation):
+        self._add_validations(domain, self._get_ids_for_domain(domain, validation_name), {validation})
 
-    def _perform(self, domain, validation_name, validation, retry_attempt=0):
-        azure_domain, subscription_id, resource_group_name, validation_name, _ = self._get_ids_for_domain(domain, validation_name)
+    def _cleanup(self, domain, validation_name, validation):
+        self._ensure_setup()
+
+        self._remove_validations(domain, self._get_ids_for_domain(domain, validation_name), {validation})
+
+    def _add_validations(self, domain, ids, validations):
+        azure_domain, subscription_id, resource_group_name, validation_name, _ = ids
         client = self._get_azure_client(subscription_id)
 
+        # Usually the record doesn't exist yet, so try creating it before reading it
+        if self._create_txt_record(client, domain, resource_group_name, azure_domain, validation_name, validations):
+            return
+
+        self._retry_concurrent_access(
+            lambda: self._add_txt_values(client, domain, resource_group_name, azure_domain, validation_name, validations),
+            domain,
+            'Failed to add TXT record for domain {}'.format(domain)
+        )
+
+    def _remove_validations(self, domain, ids, validations):
+        azure_domain, subscription_id, resource_group_name, validation_name, can_delete = ids
+        client = self._get_azure_client(subscription_id)
+
+        self._retry_concurrent_access(
+            lambda: self._remove_txt_values(client, domain, resource_group_name, azure_domain, validation_name, validations, can_delete),
+            domain,
+            'Failed to remove/empty TXT record for domain {}'.format(domain)
+        )
+
+    @staticmethod
+    def _retry_concurrent_access(update, domain, error_message):
+        """
+        Runs a TXT record update, retrying if the record was changed concurrently (HTTP 412)
+
+        Retries back off exponentially with decorrelated jitter, so retries are quick when
+        contention clears quickly and spread out when it doesn't.
+
+        :param update: Callable performing the update, raises HttpResponseError on a 412
+        :param domain: Domain the record is for, used in log messages
+        :param error_message: Error message prefix if retries are exhausted
+        """
+        sleep_secs = RETRY_BASE_SECONDS
+        for retry_attempt in range(MAX_RETRIES + 1):
+            try:
+                return update()
+            except HttpResponseError as err:
+                if err.status_code != 412:
+                    raise
+                if retry_attempt == MAX_RETRIES:
+                    raise errors.PluginError('{}, max retries due to concurrent access exceeded'
+                                             ', error: {}'.format(error_message, err))
+                # There is some parallel access on this record, sleep and try again.
+                sleep_secs = min(RETRY_CAP_SECONDS, random.uniform(RETRY_BASE_SECONDS, sleep_secs * 3))
+                logger.warning("Concurrent access to record {}, sleeping {:.1f} seconds, retry attempt: {}".format(domain, sleep_secs, retry_attempt + 1))
+                time.sleep(sleep_secs)
+
+    def _create_txt_record(self, client, domain, resource_group_name, azure_domain, validation_name, validations):
+        """
+        Creates a TXT record with the given values, if the record doesn't already exist
+
+        :return: False if the record already exists
+        """
+        try:
+            client.record_sets.create_or_update(
+                resource_group_name=resource_group_name,
+                zone_name=azure_domain,
+                relative_record_set_name=validation_name,
+                record_type='TXT',
+                if_none_match='*',
+                parameters=RecordSet(ttl=self.ttl, txt_records=[TxtRecord(value=[v]) for v in validations])
+            )
+        except HttpResponseError as err:
+            if err.status_code in (409, 412):
+                return False
+            raise errors.PluginError('Failed to add TXT record to domain '
+                                     '{}, error: {}'.format(domain, err))
+        return True
+
+    def _add_txt_values(self, client, domain, resource_group_name, azure_domain, validation_name, validations):
+        """
+        Adds values to a TXT record, keeping any existing values
+
+        :raises HttpResponseError: If the record was changed concurrently (HTTP 412)
+        """
         # Check to see if there are any existing TXT validation record values
-        txt_value = {validation}
+        txt_value = set(validations)
         etag = None
         try:
             existing_rr = client.record_sets.get(
@@ -235,11 +483,8 @@ class Authenticator(dns_common.DNSAuthenticator):
                 relative_record_set_name=validation_name,
                 record_type='TXT')
             etag = existing_rr.etag
-            for record in existing_rr.txt_records:
-                for value in record.value:
-                    if value == '-':
-                        continue
-                    txt_value.add(value)
+            txt_value.update(value for record in (existing_rr.txt_records or [])
+                             for value in record.value if value != '-')
         except HttpResponseError as err:
             if err.status_code != 404:  # Ignore RR not found
                 raise errors.PluginError('Failed to check TXT record for domain '
@@ -256,26 +501,17 @@ class Authenticator(dns_common.DNSAuthenticator):
             )
         except HttpResponseError as err:
             if err.status_code == 412:
-                # There is some parallel access on this record, sleep a random amount and try again.
-                if retry_attempt > 10:
-                    raise errors.PluginError('Failed to add TXT record for domain {}, max retries due to concurrent access exceeded'
-                                             ', error: {}'.format(domain, err))
-                sleep_secs = random.randint(1, 10)
-                retry_attempt += 1
-                logger.warning("Concurrent access to record {}, sleeping {} seconds, retry attempt: {}".format(domain, sleep_secs, retry_attempt))
-                time.sleep(sleep_secs)
-                self._perform(domain, validation_name, validation, retry_attempt)
-            else:
-                raise errors.PluginError('Failed to add TXT record to domain '
-                                         '{}, error: {}'.format(domain, err))
+                raise
+            raise errors.PluginError('Failed to add TXT record to domain '
+                                     '{}, error: {}'.format(domain, err))
 
-    def _cleanup(self, domain, validation_name, validation, retry_attempt=0):
-        if self.credential is None:
-            self._setup_credentials()
-
-        azure_domain, subscription_id, resource_group_name, validation_name, can_delete = self._get_ids_for_domain(domain, validation_name)
-        client = self._get_azure_client(subscription_id)
+    def _remove_txt_values(self, client, domain, resource_group_name, azure_domain, validation_name, validations, can_delete):
+        """
+        Removes values from a TXT record, deleting the record (or setting it to `-` if it
+        can't be deleted) once no values are left
 
+        :raises HttpResponseError: If the record was changed concurrently (HTTP 412)
+        """
         txt_value = set()
         etag = None
         try:
@@ -284,15 +520,13 @@ class Authenticator(dns_common.DNSAuthenticator):
                                                  relative_record_set_name=validation_name,
                                                  record_type='TXT')
             etag = existing_rr.etag
-            for record in existing_rr.txt_records:
-                for value in record.value:
-                    txt_value.add(value)
+            txt_value.update(value for record in (existing_rr.txt_records or []) for value in record.value)
         except HttpResponseError as err:
             if err.status_code != 404:  # Ignore RR not found
                 raise errors.PluginError('Failed to check TXT record for domain '
                                          '{}, error: {}'.format(domain, err))
 
-        txt_value -= {validation}
+        txt_value -= validations
 
         try:
             if txt_value:
@@ -325,43 +559,70 @@ class Authenticator(dns_common.DNSAuthenticator):
                     )
         except HttpResponseError as err:
             if err.status_code == 412:
-                # There is some parallel access on this record, sleep a random amount and try again.
-                if retry_attempt > 10:
-                    raise errors.PluginError('Failed to remove/empty TXT record for domain {}, max retries due to concurrent access exceeded'
-                                             ', error: {}'.format(domain, err))
-                sleep_secs = random.randint(1, 10)
-                retry_attempt += 1
-                logger.warning("Concurrent access to record {}, sleeping {} seconds, retry attempt: {}".format(domain, sleep_secs, retry_attempt))
-                time.sleep(sleep_secs)
-                self._cleanup(domain, validation_name, validation, retry_attempt)
+                raise
             elif err.status_code != 404:  # Ignore RR not found
                 raise errors.PluginError('Failed to remove/empty TXT record for domain '
                                          '{}, error: {}'.format(domain, err))
 
     def _get_azure_client(self, subscription_id):
         """
-        Gets azure DNS client
+        Gets azure DNS client, clients are cached per subscription so their connections are reused
 
         :param subscription_id: Azure subscription ID
         :type subscription_id: str
         :return: Azure DNS client
         :rtype: DnsManagementClient
         """
-        return DnsManagementClient(self.credential, subscription_id, None, self._arm_endpoint, credential_scopes=[self._arm_endpoint + "/.default"])
+        with self._clients_lock:
+            return self._get_or_create_azure_client(subscription_id)
+
+    def _get_or_create_azure_client(self, subscription_id):
+        client = self._clients.get(subscription_id)
+        if client is None:
+            # Keep connections alive between the GET and PUT of each challenge, and pool enough of
+            # them for concurrent challenges. Retries are left to the azure pipeline, it doesn't retry
+            # 412s which _retry_concurrent_access handles.
+            session = requests.Session()
+            session.mount('https://', HTTPAdapter(pool_connections=10, pool_maxsize=20, max_retries=0))
+            transport = RequestsTransport(session=session, session_owner=True,
+                                          connection_timeout=30, read_timeout=60)
+            client = DnsManagementClient(self.credential, subscription_id, None, self._arm_endpoint,
+                                         credential_scopes=[self._arm_endpoint + "/.default"],
+                                         transport=transport,
+                                         retry_policy=RetryPolicy(retry_total=3, retry_backoff_factor=0.5))
+            self._clients[subscription_id] = client
+        return client
+
+    def _close_azure_clients(self):
+        """
+        Closes all cached azure DNS clients
+        """
+        with self._clients_lock:
+            for client in self._clients.values():
+                client.close()
+            self._clients.clear()
+
+    @classmethod
+    def _parse_zone(cls, zone_id: str) -> ParsedZone:
+        """
+        :param zone_id: Resource ID from a zone mapping, a resource group, DNS zone or TXT record
+        :raises ValueError: If the resource ID can't be parsed
+        """
+        resource = cls.parse_azure_resource_id(zone_id)
+        return ParsedZone(
+            subscription_id=resource.get('subscriptions'),
+            resource_group=resource.get('resourcegroups'),
+            dns_zone=resource.get('dnszones'),
+            txt_record=resource.get('txt'),
+        )
 
     @staticmethod
     def parse_azure_resource_id(resource_id):
-        rsrc_id = resource_id
-        if rsrc_id.startswith('/'):
-            rsrc_id = rsrc_id[1:]
-
-        if rsrc_id.endswith('/'):
-            rsrc_id = rsrc_id[:-1]
-
-        if '/' not in rsrc_id:
-            raise ValueError('Invalid resource ID: {}'.format(resource_id))
-
-        parts = rsrc_id.split('/')
-        if (len(parts) % 2) != 0 or '' in parts:
+        """
+        :return: Resource ID segments keyed by their type, lowercased as Azure ignores their case
+        """
+        parts = resource_id.removeprefix('/').removesuffix('/').split('/')
+        # Segments are type/name pairs, none of which can be empty
+        if len(parts) & 1 or not all(parts):
             raise ValueError('Invalid resource ID: {}'.format(resource_id))
-        return CaseInsensitiveDict(zip(parts[0::2], parts[1::2]))
+        return {key.lower(): value for key, value in zip(parts[0::2], parts[1::2])}
@@ -9,6 +9,7 @@ install_requires = [
     'azure-identity>=1.19.0',
     'azure-mgmt-dns>=8.2.0',
     'azure-core>=1.32.0',
+    'requests',
     'setuptools>=41.6.0',
     'certbot>=3.0,<4.0',
 ]
@@ -31,7 +32,7 @@ setup(
     author="Terri Cain",
     author_email='terri@dolphincorp.co.uk',
     license='Apache License 2.0',
-    python_requires='>=3.6',
+    python_requires='>=3.9',
     classifiers=[
         'Development Status :: 5 - Production/Stable',
         'Environment :: Plugins',
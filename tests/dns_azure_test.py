@@ -14,6 +14,9 @@ from certbot.plugins import dns_test_common
 from certbot.plugins.dns_test_common import KEY
 from certbot.tests import util as test_util, acme_util
 
+from azure.core.credentials import AccessToken
+from azure.core.exceptions import HttpResponseError
+from azure.core.pipeline.transport import RequestsTransport
 from azure.mgmt.dns.models import RecordSet, TxtRecord
 
 MULTI_DOMAIN = [
@@ -28,11 +31,32 @@ SINGLE_DOMAIN = [
     achallenges.KeyAuthorizationAnnotatedChallenge(
         challb=acme_util.DNS01, domain='example.com', account_key=KEY),
 ]
+
 SUB_DOMAIN = [
     achallenges.KeyAuthorizationAnnotatedChallenge(
         challb=acme_util.DNS01, domain='a.b.example.com', account_key=KEY),
 ]
 
+# A wildcard and its apex domain, both validated at _acme-challenge.example.com
+WILDCARD_DOMAIN = [
+    achallenges.KeyAuthorizationAnnotatedChallenge(
+        challb=acme_util.DNS01, domain='example.com', account_key=KEY),
+    achallenges.KeyAuthorizationAnnotatedChallenge(
+        challb=acme_util.DNS01_P_2, domain='example.com', account_key=KEY),
+]
+
+
+def http_error(status_code):
+    err = HttpResponseError(message='HTTP {}'.format(status_code))
+    err.status_code = status_code
+    return err
+
+
+def calls_by_record(mock_method):
+    """Challenges are updated concurrently, so index calls by (zone, record name) instead of order"""
+    return {(call[1]['zone_name'], call[1]['relative_record_set_name']): call
+            for call in mock_method.call_args_list}
+
 
 class AuthenticatorTest(test_util.TempDirTestCase, dns_test_common.BaseAuthenticatorTest):
 
@@ -112,12 +136,15 @@ class AuthenticatorTest(test_util.TempDirTestCase, dns_test_common.BaseAuthentic
 
         self.auth.perform(MULTI_DOMAIN)
 
-        # Check azure client call counts
-        self.assertEqual(self.mock_client.record_sets.get.call_count, 3)
+        # Check azure client call counts, the records don't exist so they're created without reading them
+        self.assertEqual(self.mock_client.record_sets.get.call_count, 0)
         self.assertEqual(self.mock_client.record_sets.create_or_update.call_count, 3)
 
         #
-        zone1_call, zone2_call, zone3_call = self.mock_client.record_sets.create_or_update.call_args_list
+        calls = calls_by_record(self.mock_client.record_sets.create_or_update)
+        zone1_call = calls[("example.com", zone1_relative_record)]
+        zone2_call = calls[("example.org", zone2_relative_record)]
+        zone3_call = calls[("example.com", zone3_relative_record)]
         self.assertEqual(zone1_call[1]['zone_name'], "example.com")
         self.assertEqual(zone1_call[1]['record_type'], "TXT")
         self.assertEqual(zone1_call[1]['relative_record_set_name'], zone1_relative_record)
@@ -143,6 +170,8 @@ class AuthenticatorTest(test_util.TempDirTestCase, dns_test_common.BaseAuthentic
         self.mock_client.record_sets.get.return_value = RecordSet(txt_records=[
             TxtRecord(value=['someexistingkey'])
         ])
+        # Creating the record fails as it already exists
+        self.mock_client.record_sets.create_or_update.side_effect = [http_error(412), None]
 
         # Extract zone TXT record name and value
         zone1_req = SINGLE_DOMAIN[0]
@@ -154,7 +183,7 @@ class AuthenticatorTest(test_util.TempDirTestCase, dns_test_common.BaseAuthentic
 
         # Check azure client call counts
         self.assertEqual(self.mock_client.record_sets.get.call_count, 1)
-        self.assertEqual(self.mock_client.record_sets.create_or_update.call_count, 1)
+        self.assertEqual(self.mock_client.record_sets.create_or_update.call_count, 2)
 
         #
         expected = [self.mock_client.record_sets.create_or_update.call(
@@ -163,10 +192,11 @@ class AuthenticatorTest(test_util.TempDirTestCase, dns_test_common.BaseAuthentic
             relative_record_set_name=zone1_domain_name,
             parameters=RecordSet(txt_records=[TxtRecord(value=[zone1_key]), TxtRecord(value=['someexistingkey'])])
         )]
-        zone1_call = self.mock_client.record_sets.create_or_update.call_args_list[0]
+        zone1_call = self.mock_client.record_sets.create_or_update.call_args_list[1]
         self.assertEqual(zone1_call[1]['zone_name'], "example.com")
         self.assertEqual(zone1_call[1]['record_type'], "TXT")
         self.assertEqual(zone1_call[1]['relative_record_set_name'], zone1_relative_record)
+        self.assertNotIn('if_none_match', zone1_call[1])
         zone1_txt_records = zone1_call[1]['parameters'].txt_records
 
         self.assertEqual(len(zone1_txt_records), 2)
@@ -187,18 +217,73 @@ class AuthenticatorTest(test_util.TempDirTestCase, dns_test_common.BaseAuthentic
         self.auth.perform(SUB_DOMAIN)
 
         # Check azure client call counts
-        self.assertEqual(self.mock_client.record_sets.get.call_count, 1)
+        self.assertEqual(self.mock_client.record_sets.get.call_count, 0)
         self.assertEqual(self.mock_client.record_sets.create_or_update.call_count, 1)
 
         #
         zone1_call = self.mock_client.record_sets.create_or_update.call_args_list[0]
         self.assertEqual(zone1_call[1]['zone_name'], "example.com")
         self.assertEqual(zone1_call[1]['record_type'], "TXT")
+        self.assertEqual(zone1_call[1]['if_none_match'], '*')
         self.assertEqual(zone1_call[1]['relative_record_set_name'], relative_record)
         zone1_txt_records = zone1_call[1]['parameters'].txt_records
         self.assertEqual(len(zone1_txt_records), 1)
         self.assertEqual(zone1_txt_records[0].value[0], zone1_key)
 
+    def test_perform_shared_record(self):
+        self.mock_client.record_sets.get.return_value = RecordSet(txt_records=[])
+        keys = {req.validation(req.account_key) for req in WILDCARD_DOMAIN}
+
+        self.auth.perform(WILDCARD_DOMAIN)
+
+        # Both values are written to the record in one update
+        self.assertEqual(self.mock_client.record_sets.get.call_count, 0)
+        self.assertEqual(self.mock_client.record_sets.create_or_update.call_count, 1)
+        zone1_call = self.mock_client.record_sets.create_or_update.call_args_list[0]
+        self.assertEqual(zone1_call[1]['relative_record_set_name'], '_acme-challenge')
+        txt_values = {rr.value[0] for rr in zone1_call[1]['parameters'].txt_records}
+        self.assertEqual(txt_values, keys)
+
+    def test_perform_token_warmup(self):
+        self.mock_credentials.get_token.side_effect = Exception('token unavailable')
+
+        # A failed warm up doesn't stop the DNS updates
+        self.auth.perform(SINGLE_DOMAIN)
+
+        self.mock_credentials.get_token.assert_called_once_with('https://management.azure.com//.default')
+        self.assertEqual(self.mock_client.record_sets.create_or_update.call_count, 1)
+
+    @mock.patch('certbot_dns_azure._internal.dns_azure.time.sleep')
+    def test_perform_retry_concurrent_access(self, mock_sleep):
+        self.mock_client.record_sets.get.return_value = RecordSet(txt_records=[])
+        # The record exists, then is changed concurrently twice
+        self.mock_client.record_sets.create_or_update.side_effect = [
+            http_error(412), http_error(412), http_error(412), None]
+
+        self.auth.perform(SINGLE_DOMAIN)
+
+        # Each retry re-reads the record before updating it
+        self.assertEqual(self.mock_client.record_sets.get.call_count, 3)
+        self.assertEqual(self.mock_client.record_sets.create_or_update.call_count, 4)
+        # Ignore the propagation sleep, which is 0 in tests
+        retry_sleeps = [call[0][0] for call in mock_sleep.call_args_list if call[0][0]]
+        self.assertEqual(len(retry_sleeps), 2)
+        for sleep_secs in retry_sleeps:
+            self.assertGreaterEqual(sleep_secs, 1)
+            self.assertLessEqual(sleep_secs, 30)
+
+    @mock.patch('certbot_dns_azure._internal.dns_azure.time.sleep')
+    def test_perform_retry_exhausted(self, mock_sleep):
+        self.mock_client.record_sets.get.return_value = RecordSet(txt_records=[])
+        self.mock_client.record_sets.create_or_update.side_effect = http_error(412)
+
+        with self.assertRaises(errors.PluginError) as cm:
+            self.auth.perform(SINGLE_DOMAIN)
+        self.assertIn('max retries due to concurrent access exceeded', cm.exception.args[0])
+        # One create, then the first attempt and 11 retries
+        self.assertEqual(self.mock_client.record_sets.create_or_update.call_count, 13)
+        self.assertEqual(mock_sleep.call_count, 11)
+
     def test_cleanup_multiple(self):
         self.mock_client.record_sets.get.return_value = RecordSet(txt_records=[])
 
@@ -219,7 +304,10 @@ class AuthenticatorTest(test_util.TempDirTestCase, dns_test_common.BaseAuthentic
         self.assertEqual(self.mock_client.record_sets.get.call_count, 3)
         self.assertEqual(self.mock_client.record_sets.delete.call_count, 3)
 
-        zone1_call, zone2_call, zone3_call = self.mock_client.record_sets.delete.call_args_list
+        calls = calls_by_record(self.mock_client.record_sets.delete)
+        zone1_call = calls[("example.com", zone1_relative_record)]
+        zone2_call = calls[("example.org", zone2_relative_record)]
+        zone3_call = calls[("example.com", zone3_relative_record)]
         self.assertEqual(zone1_call[1]['zone_name'], "example.com")
         self.assertEqual(zone1_call[1]['record_type'], "TXT")
         self.assertEqual(zone1_call[1]['relative_record_set_name'], zone1_relative_record)
@@ -264,6 +352,106 @@ class AuthenticatorTest(test_util.TempDirTestCase, dns_test_common.BaseAuthentic
         self.assertNotIn(zone1_key, txt_values)
         self.assertIn('someexistingkey', txt_values)
 
+    def test_cleanup_reuses_setup(self):
+        self.auth.perform(SINGLE_DOMAIN)
+        self.auth.cleanup(SINGLE_DOMAIN)
+
+        self.assertEqual(self.auth._get_azure_credentials.call_count, 1)  # pylint: disable=protected-access
+
+    def test_cleanup_shared_record(self):
+        self.mock_client.record_sets.get.return_value = RecordSet(txt_records=[
+            TxtRecord(value=[req.validation(req.account_key)]) for req in WILDCARD_DOMAIN
+        ])
+
+        # _attempt_cleanup | pylint: disable=protected-access
+        self.auth._attempt_cleanup = True
+        self.auth.cleanup(WILDCARD_DOMAIN)
+
+        # Removing both values empties the record, so it's deleted in one call
+        self.assertEqual(self.mock_client.record_sets.get.call_count, 1)
+        self.assertEqual(self.mock_client.record_sets.create_or_update.call_count, 0)
+        self.assertEqual(self.mock_client.record_sets.delete.call_count, 1)
+
+    def test_get_ids_for_domain_closest_parent(self):
+        self.auth.domain_zoneinfo = {
+            'example.com': self.auth._parse_zone('/subscriptions/c135abce-d87d-48df-936c-15596c6968a5/resourceGroups/dns1'),
+            'b.example.com': self.auth._parse_zone('/subscriptions/99800903-fb14-4992-9aff-12eaf2744622/resourceGroups/dns2'),
+        }
+        self.auth._zone_trie = self.auth._build_zone_trie(self.auth.domain_zoneinfo)
+
+        zone, subscription_id, rg_name, relative_name, can_delete = self.auth._get_ids_for_domain(
+            'a.b.example.com', '_acme-challenge.a.b.example.com')
+        self.assertEqual(zone, 'b.example.com')
+        self.assertEqual(subscription_id, '99800903-fb14-4992-9aff-12eaf2744622')
+        self.assertEqual(rg_name, 'dns2')
+        self.assertEqual(relative_name, '_acme-challenge.a')
+        self.assertTrue(can_delete)
+
+        zone, _, rg_name, relative_name, _ = self.auth._get_ids_for_domain(
+            'a.example.com', '_acme-challenge.a.example.com')
+        self.assertEqual(zone, 'example.com')
+        self.assertEqual(rg_name, 'dns1')
+        self.assertEqual(relative_name, '_acme-challenge.a')
+
+        # Matches are on whole labels only
+        with self.assertRaises(errors.PluginError) as cm:
+            self.auth._get_ids_for_domain('badexample.com', '_acme-challenge.badexample.com')
+        self.assertIn('does not have a valid domain to resource group id mapping', cm.exception.args[0])
+
+    def test_get_relative_domain(self):
+        # pylint: disable=protected-access
+        self.assertEqual(self.auth._get_relative_domain('example.com', 'example.com'), '@')
+        self.assertEqual(self.auth._get_relative_domain('_acme-challenge.a.example.com', 'example.com'),
+                         '_acme-challenge.a')
+        self.assertEqual(self.auth._get_relative_domain('_acme-challenge.example.com', 'example.com.'),
+                         '_acme-challenge')
+        # Only the zone suffix is removed
+        self.assertEqual(self.auth._get_relative_domain('_acme-challenge.example.com.example.com', 'example.com'),
+                         '_acme-challenge.example.com')
+        # Names outside the zone are left alone
+        self.assertEqual(self.auth._get_relative_domain('_acme-challenge.example.net', 'example.com'),
+                         '_acme-challenge.example.net')
+        self.assertEqual(self.auth._get_relative_domain('_acme-challenge.myexample.com', 'example.com'),
+                         '_acme-challenge.myexample.com')
+
+    def test_parse_azure_resource_id(self):
+        self.assertEqual(
+            self.auth.parse_azure_resource_id('/subscriptions/c135abce/resourceGroups/dns1/'
+                                              'providers/Microsoft.Network/dnsZones/example.com/TXT/other/'),
+            {'subscriptions': 'c135abce', 'resourcegroups': 'dns1', 'providers': 'Microsoft.Network',
+             'dnszones': 'example.com', 'txt': 'other'})
+        self.assertEqual(self.auth.parse_azure_resource_id('subscriptions/c135abce'), {'subscriptions': 'c135abce'})
+
+        for resource_id in ('', '/', 'subscriptions', '/subscriptions/c135abce/resourceGroups',
+                            '/subscriptions//resourceGroups/dns1', '//subscriptions/c135abce/resourceGroups/dns1',
+                            '/subscriptions/c135abce/resourceGroups/dns1//'):
+            with self.subTest(resource_id=resource_id):
+                with self.assertRaises(ValueError):
+                    self.auth.parse_azure_resource_id(resource_id)
+
+    def test_get_azure_client_cached(self):
+        from certbot_dns_azure._internal.dns_azure import Authenticator
+
+        auth = Authenticator(self.sp_config, "azure")
+        auth._arm_endpoint = 'https://management.azure.com/'
+        with mock.patch('certbot_dns_azure._internal.dns_azure.DnsManagementClient') as client_cls:
+            client_cls.side_effect = lambda *args, **kwargs: mock.MagicMock()
+            client1 = auth._get_azure_client('c135abce-d87d-48df-936c-15596c6968a5')
+            client2 = auth._get_azure_client('c135abce-d87d-48df-936c-15596c6968a5')
+            client3 = auth._get_azure_client('99800903-fb14-4992-9aff-12eaf2744622')
+
+        # One client per subscription
+        self.assertIs(client1, client2)
+        self.assertIsNot(client1, client3)
+        self.assertEqual(client_cls.call_count, 2)
+        self.assertIsInstance(client_cls.call_args[1]['transport'], RequestsTransport)
+
+        # Clients are closed and dropped once cleanup finishes
+        auth.cleanup([])
+        client1.close.assert_called_once_with()
+        client3.close.assert_called_once_with()
+        self.assertEqual(auth._clients, {})
+
     def test_config_missing_auth(self):
         # Test no auth info
         dns_test_common.write({}, self.sp_config.azure_config)
@@ -307,5 +495,34 @@ class AuthenticatorTest(test_util.TempDirTestCase, dns_test_common.BaseAuthentic
         self.assertIn('Failed to parse resource ID for example.com', cm.exception.args[0])
 
 
+class CachingCredentialTest(unittest.TestCase):
+
+    def setUp(self):
+        from certbot_dns_azure._internal.dns_azure import _CachingCredential
+
+        self.inner = mock.MagicMock()
+        self.credential = _CachingCredential(self.inner)
+
+    @mock.patch('certbot_dns_azure._internal.dns_azure.time.time', return_value=1000)
+    def test_token_reused(self, _):
+        self.inner.get_token.return_value = AccessToken('token1', 4600)
+
+        self.assertEqual(self.credential.get_token('scope/.default').token, 'token1')
+        self.assertEqual(self.credential.get_token('scope/.default').token, 'token1')
+        self.assertEqual(self.inner.get_token.call_count, 1)
+
+        # Different scopes get their own token
+        self.credential.get_token('other/.default')
+        self.assertEqual(self.inner.get_token.call_count, 2)
+
+    @mock.patch('certbot_dns_azure._internal.dns_azure.time.time', return_value=1000)
+    def test_token_refreshed_before_expiry(self, _):
+        self.inner.get_token.side_effect = [AccessToken('token1', 1200), AccessToken('token2', 4600)]
+
+        self.assertEqual(self.credential.get_token('scope/.default').token, 'token1')
+        self.assertEqual(self.credential.get_token('scope/.default').token, 'token2')
+        self.assertEqual(self.inner.get_token.call_count, 2)
+
+
 if __name__ == "__main__":
     unittest.main()  # pragma: no cover